@@ -244,7 +244,7 @@ class ContainerBase(object):
         then unlink it. If it is a symbolic link, then remove it.
         """
         try:
-            if os.path.isdir(node):
+            if os.path.isdir(node) and not os.path.islink(node):
                 shutil.rmtree(node)
             else:
                 os.unlink(node)
@@ -491,19 +491,34 @@ def _fetch_script(info,
                   script_path,
                   domain="raw.githubusercontent.com",
                   urlpath=_GITHUB_URLPATH):
-    """Download a script if it doesn't exist."""
-    if not os.path.exists(info.fs_path):
-        with open_and_force_mkdir(info.fs_path, "w") as scr:
-            remote = "%s/%s/%s" % (domain, urlpath, script_path)
-            retrycount = 100
-            while retrycount != 0:
-                try:
-                    contents = urlopen("http://{0}".format(remote)).read()
-                    scr.write(contents.decode())
-                    scr.truncate()
-                    retrycount = 0
-                except URLError:
-                    retrycount -= 1
+    """Download a script if it doesn't exist.
+
+    The script is written to a temporary file and only renamed into place
+    once it has been completely downloaded. A failed download never leaves
+    an empty or truncated script behind which would otherwise be imported
+    on every subsequent run.
+    """
+    if os.path.exists(info.fs_path):
+        return
+
+    remote = "%s/%s/%s" % (domain, urlpath, script_path)
+    retrycount = 100
+    while retrycount != 0:
+        try:
+            contents = urlopen("http://{0}".format(remote)).read()
+            break
+        except URLError:
+            retrycount -= 1
+    else:
+        # There's nothing to import if the script couldn't be fetched,
+        # so say why instead of failing later on a missing file.
+        raise RuntimeError("""Failed to download {0}""".format(remote))
+
+    download_path = info.fs_path + ".download"
+    with open_and_force_mkdir(download_path, "w") as scr:
+        scr.write(contents.decode())
+
+    os.rename(download_path, info.fs_path)
 
 
 def _update_scripts_sha1_and_rmtree(scripts_dir, cache_dir, sha1):
@@ -696,14 +711,17 @@ class ContainerDir(ContainerBase):
             name = "local_module_" + re.sub(r"[\./]", "_", path)
             return imp.load_source(name, path)
 
-        # First try to find the script locally in the
-        # current working directory.
-        info = self.fetch_script(script_path, domain, urlpath)
         key = "{0}/{1}/{2}".format(domain, urlpath, script_path)
 
+        # Scripts only get into the module cache once they have been
+        # fetched, so there's no need to look for them on disk again.
         try:
             return self._module_cache[key]
         except KeyError:
+            # First try to find the script locally in the
+            # current working directory.
+            info = self.fetch_script(script_path, domain, urlpath)
+
             # We try to import the file normally first - this is useful
             # for tests where we want to be able to get coverage on those
             # files. If we can't import directly, then we need to
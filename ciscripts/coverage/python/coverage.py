@@ -12,6 +12,11 @@ def run(cont, util, shell, argv=None):
     """Submit coverage total to coveralls."""
     del argv
 
+    # Coverage totals are only ever uploaded from CI, so there is no
+    # point getting the python container if we are not running there.
+    if os.environ.get("CI", None) is None:
+        return
+
     with util.Task("""Submitting coverage totals"""):
         py_ver = util.language_version("python3")
         configure_python = "setup/project/configure_python.py"
@@ -20,7 +25,6 @@ def run(cont, util, shell, argv=None):
                                                               shell,
                                                               py_ver)
 
-        if os.environ.get("CI", None) is not None:
-            with util.Task("""Uploading to coveralls"""):
-                with py_cont.activated(util):
-                    util.execute(cont, util.running_output, "coveralls",)
+        with util.Task("""Uploading to coveralls"""):
+            with py_cont.activated(util):
+                util.execute(cont, util.running_output, "coveralls",)
@@ -30,6 +30,7 @@ from itertools import chain
 
 
 _KNOWN_PYTHON_INSTALLATIONS = dict()
+_PYTHON_VERSION_STRINGS = dict()
 
 
 # suppress(invalid-name)
@@ -39,11 +40,22 @@ def _get_python_version_from_specified(version, precision):
 
 
 def _get_python_version_string(python_executable):
-    """Get the version string for a python executable."""
+    """Get the version string for a python executable.
+
+    The version string is remembered for each executable, since asking
+    the same python for its version again means spawning it again.
+    """
+    try:
+        return _PYTHON_VERSION_STRINGS[python_executable]
+    except KeyError:  # suppress(pointless-except)
+        pass
+
     output = subprocess.Popen([python_executable, "--version"],
                               stdout=subprocess.PIPE,
                               stderr=subprocess.PIPE).communicate()
-    return "".join([o.decode() for o in output])
+    version_string = "".join([o.decode() for o in output])
+    _PYTHON_VERSION_STRINGS[python_executable] = version_string
+    return version_string
 
 
 def get_python_version(util, precision):  # suppress(unused-function)
@@ -181,11 +193,11 @@ def _packages_to_install(installed, requested):
         return False
 
     # Do some simple version checks
-    version_symbols_regex = r">|>=|==|<=|<"
-    pkgs = [r for r in requested
-            if out_of_date(real_identifier(r),
-                           installed.get(re.split(version_symbols_regex,
-                                                  real_identifier(r))[0]))]
+    version_symbols = re.compile(r">|>=|==|<=|<")
+    identifiers = [(r, real_identifier(r)) for r in requested]
+    pkgs = [r for r, ident in identifiers
+            if out_of_date(ident,
+                           installed.get(version_symbols.split(ident)[0]))]
 
     return list(set(pkgs))
 
@@ -199,19 +211,18 @@ def _upgrade_pip(cont, util):
         return
 
     try:
-        version = subprocess.check_output([util.which("pip"),
+        version = subprocess.check_output([pip,
                                            "--disable-pip-version-check",
                                            "--version"],
                                           stderr=subprocess.STDOUT)
     except subprocess.CalledProcessError:
         # Try again without the version check argument - it could
         # not be disabled on some older versions of pip
-        version = subprocess.check_output([util.which("pip"),
-                                           "--version"])
+        version = subprocess.check_output([pip, "--version"])
 
-    version = version.split()[1].decode()
+    version = LooseVersion(version.split()[1].decode())
 
-    if LooseVersion(version) < LooseVersion("9.0.1"):
+    if version < LooseVersion("9.0.1"):
         arguments = [
             "python",
             "-m",
@@ -221,7 +232,7 @@ def _upgrade_pip(cont, util):
             "pip"
         ]
 
-        if LooseVersion(version) > LooseVersion("6.0.3"):
+        if version > LooseVersion("6.0.3"):
             arguments.append("--disable-pip-version-check")
 
         util.execute(cont,
@@ -345,7 +356,7 @@ def pip_install_deps(cont, util, target, *args, **kwargs):
     initially_installed_packages = _PACKAGES_FOR_PYTHON[active_python]
 
     to_install = _dependencies_to_update(cont,
-                                         util.which("python"),
+                                         active_python,
                                          initially_installed_packages,
                                          target)
     to_install += _packages_to_install(initially_installed_packages,
@@ -15,15 +15,28 @@ import subprocess
 
 
 _KNOWN_RUBY_INSTALLATIONS = dict()
+_RUBY_VERSION_STRINGS = dict()
 
 
-# suppress(invalid-name)
-def get_ruby_version_from_specified(ruby_executable, precision):
-    """Get python version at precision from specified ruby_executable."""
+def _get_ruby_version_string(ruby_executable):
+    """Get the version string for a ruby executable, caching the result."""
+    try:
+        return _RUBY_VERSION_STRINGS[ruby_executable]
+    except KeyError:  # suppress(pointless-except)
+        pass
+
     output = subprocess.Popen([ruby_executable, "--version"],
                               stdout=subprocess.PIPE,
                               stderr=subprocess.PIPE).communicate()
-    version = "".join([o.decode() for o in output])
+    version_string = "".join([o.decode() for o in output])
+    _RUBY_VERSION_STRINGS[ruby_executable] = version_string
+    return version_string
+
+
+# suppress(invalid-name)
+def get_ruby_version_from_specified(ruby_executable, precision):
+    """Get python version at precision from specified ruby_executable."""
+    version = _get_ruby_version_string(ruby_executable)
     version = ".".join(version.split(" ")[1].split(".")[0:precision]).strip()
     return re.compile(r"([0-9\.]+)").match(version).group(1)
 
@@ -31,6 +31,14 @@ DEFAULT_DISTRO_RELEASE_FOR_SYSTEM = {
     "Windows": "8.1"
 }
 
+EXECUTABLE_PATH_COMPONENTS_FOR_SYSTEM = {
+    "Linux": (("usr", "bin"), ("bin", )),
+    "Darwin": (("bin", ), ),
+    "Windows": (("bin", ), )
+}
+
+_SYSTEM = platform.system()
+
 
 def _format_subdir_name(distro, version, arch):
     """Return subdirectory name for container information."""
@@ -52,8 +60,8 @@ def get(container,
         util,
         shell,
         ver_info,
-        distro=DEFAULT_DISTRO_FOR_SYSTEM[platform.system()],
-        distro_version=DEFAULT_DISTRO_RELEASE_FOR_SYSTEM[platform.system()],
+        distro=DEFAULT_DISTRO_FOR_SYSTEM[_SYSTEM],
+        distro_version=DEFAULT_DISTRO_RELEASE_FOR_SYSTEM[_SYSTEM],
         distro_arch=None):
     """Return a OSContainer for an installed operating system container."""
     del ver_info
@@ -82,6 +90,13 @@ def get(container,
             self._distro = distro
             self._distro_version = distro_version
             self._distro_arch = distro_arch
+            self._root_fs_path = None
+
+            components = EXECUTABLE_PATH_COMPONENTS_FOR_SYSTEM.get(_SYSTEM,
+                                                                   tuple())
+            self._exec_path = os.pathsep.join([
+                os.path.join(installation, *c) for c in components
+            ])
             with py_cont.activated(util):
                 self._exec_script = util.which("psq-travis-container-exec")
 
@@ -126,30 +141,23 @@ def get(container,
             path which is the "fake root". On other operating system
             containers, it is effectively the prefix where programs
             are installed to.
+
+            The path does not change for the lifetime of this container,
+            so it is only looked up once.
             """
-            args = self._container_specification_args()
-            return subprocess.check_output(["psq-travis-container-get-root",
-                                            self._installation] + args)
+            if self._root_fs_path is None:
+                args = ([
+                    "psq-travis-container-get-root",
+                    self._installation
+                ] + self._container_specification_args())
+                self._root_fs_path = subprocess.check_output(args)
+
+            return self._root_fs_path
 
         def _active_environment(self, tuple_type):
             """Return variables that make up this container's active state."""
-            executable_path = ""
-
-            if platform.system() == "Linux":
-                executable_path = os.pathsep.join([
-                    os.path.join(self._installation,
-                                 "usr",
-                                 "bin"),
-                    os.path.join(self._installation,
-                                 "bin")
-                ])
-            elif platform.system() == "Darwin":
-                executable_path = os.path.join(self._installation, "bin")
-            elif platform.system() == "Windows":
-                executable_path = os.path.join(self._installation, "bin")
-
             env_to_prepend = {
-                "PATH": executable_path
+                "PATH": self._exec_path
             }
 
             return tuple_type(overwrite=dict(),
@@ -195,8 +203,16 @@ def _update_os_container(container,
         repositories_exists = os.path.exists(repositories)
         packages_exists = os.path.exists(packages)
 
-        if not (repositories_exists or packages_exists):
-            return (not os.path.exists(os_container_path), [])
+        # If the container doesn't exist yet then it has to be created
+        # with everything in it, so there's no need to compare against
+        # what was installed last time.
+        if not os.path.exists(os_container_path):
+            if repositories_exists:
+                options.append("--repositories={}".format(repositories))
+            if packages_exists:
+                options.append("--packages={}".format(packages))
+
+            return (True, options)
 
         if (repositories_exists and
                 not util.compare_contents(repositories,
@@ -262,8 +278,8 @@ def run(container,
         util,
         shell,
         ver_info,
-        distro=DEFAULT_DISTRO_FOR_SYSTEM[platform.system()],
-        distro_version=DEFAULT_DISTRO_RELEASE_FOR_SYSTEM[platform.system()],
+        distro=DEFAULT_DISTRO_FOR_SYSTEM[_SYSTEM],
+        distro_version=DEFAULT_DISTRO_RELEASE_FOR_SYSTEM[_SYSTEM],
         distro_arch=None,
         distro_repositories=None,
         distro_packages=None):
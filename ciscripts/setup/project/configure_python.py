@@ -63,6 +63,10 @@ def get(container, util, shell, ver_info):
             self._version = version
             assert os.path.exists(self._installation)
 
+            # site-packages is looked up on first activation.
+            self._exec_path = PythonContainer._get_exec_path_from(installation)
+            self._site_packages = None
+
         @staticmethod
         def _get_py_path_from(installation):
             """Given an installation, get the python library dir."""
@@ -111,24 +115,21 @@ def get(container, util, shell, ver_info):
 
             py_path = self._installation
 
-            util_mod.apply_to_files(self.delete, py_path, matching=["*.a"])
-
-            util_mod.apply_to_files(self.delete, py_path, matching=["*.pyc"])
-            util_mod.apply_to_files(self.delete, py_path, matching=["*.pyo"])
-            util_mod.apply_to_files(self.delete, py_path, matching=["*.chm"])
-            util_mod.apply_to_files(self.delete, py_path, matching=["*.html"])
-            util_mod.apply_to_files(self.delete, py_path, matching=["*.pyo"])
-            util_mod.apply_to_files(self.delete, py_path, matching=["*.whl"])
+            # Match all the cruft in a single pass over the installation
+            # as opposed to walking the whole tree once per pattern.
             util_mod.apply_to_files(self.delete,
                                     py_path,
-                                    matching=["*.egg-link"])
+                                    matching=["*.a",
+                                              "*.pyc",
+                                              "*.pyo",
+                                              "*.chm",
+                                              "*.html",
+                                              "*.whl",
+                                              "*.egg-link"])
 
             util_mod.apply_to_directories(util_mod.force_remove_tree,
                                           py_path,
-                                          matching=["*/test/*"])
-            util_mod.apply_to_directories(util_mod.force_remove_tree,
-                                          py_path,
-                                          matching=["*/tcl/*"])
+                                          matching=["*/test/*", "*/tcl/*"])
 
             def reset_mtime(path):
                 """Reset modification time of file at path to 1.
@@ -162,14 +163,16 @@ def get(container, util, shell, ver_info):
 
         def _active_environment(self, tuple_type):
             """Return active environment for python container."""
-            py_path = PythonContainer._get_py_path_from(self._installation)
-            exec_path = PythonContainer._get_exec_path_from(self._installation)
+            if self._site_packages is None:
+                py_path = PythonContainer._get_py_path_from(self._installation)
+                self._site_packages = os.path.join(py_path, "site-packages")
+
             env_to_overwrite = {
-                "PYTHONPATH": os.path.join(py_path, "site-packages"),
+                "PYTHONPATH": self._site_packages,
                 "VIRTUAL_ENV": self._installation
             }
             env_to_prepend = {
-                "PATH": exec_path
+                "PATH": self._exec_path
             }
 
             return tuple_type(overwrite=env_to_overwrite,
@@ -180,7 +183,12 @@ def get(container, util, shell, ver_info):
 
 def posix_installer(lang_dir, python_build_dir, util, container, shell):
     """Use pyenv to install python on a posix-compatible operating system."""
-    if not os.path.exists(python_build_dir):
+    py_build = os.path.join(python_build_dir, "bin", "python-build")
+
+    # Check for the python-build script itself as opposed to its
+    # installation directory, so that a previously failed install gets
+    # completed instead of being mistaken for a finished one.
+    if not os.path.exists(py_build):
         with container.in_temp_cache_dir() as tmp:
             with util.Task("""Downloading pyenv"""):
                 remote = "git://github.com/yyuu/pyenv"
@@ -209,9 +217,6 @@ def posix_installer(lang_dir, python_build_dir, util, container, shell):
 
         if not os.path.exists(py_cont):
             with util.Task("""Installing python version """ + version):
-                py_build = os.path.join(python_build_dir,
-                                        "bin",
-                                        "python-build")
                 util.execute(container,
                              util.long_running_suppressed_output(),
                              "bash",
@@ -249,7 +254,9 @@ def windows_installer(lang_dir, python_build_dir, util, container, shell):
                       "wb") as installer:
                 remote = util.url_opener()(url.format(ver=version))
                 with closing(remote):
-                    installer.write(remote.read())
+                    # Copy across in chunks, so that we never have to
+                    # hold the entire installer in memory.
+                    shutil.copyfileobj(remote, installer, 64 * 1024)
 
             with util.Task("""Installing python version """ + version):
                 installer = os.path.realpath(installer.name)
@@ -268,6 +275,33 @@ def windows_installer(lang_dir, python_build_dir, util, container, shell):
     return install
 
 
+def _extract_within(tar, path):
+    """Extract each member of tar into path, refusing to escape it.
+
+    Members are extracted in the order they are read, so this works for
+    tar files opened in streaming mode.
+    """
+    abs_path = os.path.abspath(path)
+
+    # Compare against abs_path with a trailing separator so that a
+    # sibling like /path-other is not mistaken for being inside /path.
+    abs_prefix = os.path.join(abs_path, "")
+
+    # Newer versions of python have extraction filters, which warn when
+    # not specified. Use the "data" filter where it is available.
+    extract_kwargs = dict()
+    if hasattr(tarfile, "data_filter"):
+        extract_kwargs["filter"] = "data"
+
+    for member in tar:
+        target = os.path.abspath(os.path.join(path, member.name))
+        if target != abs_path and not target.startswith(abs_prefix):
+            raise RuntimeError("""Refusing to extract {0} outside of """
+                               """{1}""".format(member.name, path))
+
+        tar.extract(member, path, **extract_kwargs)
+
+
 def _virtualenv_script(container, util):
     """Return location of virtualenv script, fetching if necessary."""
     python_venv = container.language_dir("python-venv")
@@ -276,37 +310,15 @@ def _virtualenv_script(container, util):
     if not os.path.exists(virtualenv_install):
         with container.in_temp_cache_dir() as cache_dir:
             with util.in_dir(cache_dir):
-                local_name = os.path.join(cache_dir,
-                                          os.path.basename(remote_url))
-                with open(local_name, "wb") as local_file:
-                    remote = util.url_opener()(remote_url)
-                    with closing(remote):
-                        local_file.write(remote.read())
-
-                with tarfile.open(local_name) as local_tar:
-                    def is_within_directory(directory, target):
-                        
-                        abs_directory = os.path.abspath(directory)
-                        abs_target = os.path.abspath(target)
-                    
-                        prefix = os.path.commonprefix([abs_directory, abs_target])
-                        
-                        return prefix == abs_directory
-                    
-                    def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
-                    
-                        for member in tar.getmembers():
-                            member_path = os.path.join(path, member.name)
-                            if not is_within_directory(path, member_path):
-                                raise Exception("Attempted Path Traversal in Tar File")
-                    
-                        tar.extractall(path, members, numeric_owner=numeric_owner) 
-                        
-                    
-                    safe_extract(local_tar)
-
-                directory_name = [d for d in os.listdir(".")
-                                  if os.path.basename(remote_url) not in d][0]
+                # Extract the tarball as it arrives instead of writing
+                # it out to disk first and then reading it back in.
+                remote = util.url_opener()(remote_url)
+                with closing(remote):
+                    with tarfile.open(fileobj=remote,
+                                      mode="r|gz") as remote_tar:
+                        _extract_within(remote_tar, ".")
+
+                directory_name = os.listdir(".")[0]
                 shutil.rmtree(python_venv)
                 shutil.copytree(directory_name, python_venv)
 
@@ -14,6 +14,8 @@ import os.path
 
 import platform
 
+import shutil
+
 from collections import defaultdict, namedtuple
 
 from contextlib import closing
@@ -62,6 +64,12 @@ def get(container, util, shell, ver_info):
             assert os.path.exists(self._installation)
             assert os.path.exists(self._system_installation)
 
+            self._gem_dirs = None
+            self._exec_path = os.pathsep.join([
+                os.path.join(self._system_installation, "bin"),
+                os.path.join(self._installation, "bin")
+            ])
+
             if (platform.system() == "Darwin" and
                     not (os.path.exists("/etc/openssl/cert.pem") or
                          os.path.exists("/usr/local/etc/openssl/cert.pem"))):
@@ -78,17 +86,14 @@ def get(container, util, shell, ver_info):
 
             rb_path = self._installation
 
-            util_mod.apply_to_files(self.delete, rb_path, matching=["*.a"])
-            util_mod.apply_to_files(self.delete, rb_path, matching=["*.chm"])
-            util_mod.apply_to_files(self.delete, rb_path, matching=["*.pdf"])
-            util_mod.apply_to_files(self.delete, rb_path, matching=["*.html"])
-
             util_mod.apply_to_files(self.delete,
                                     rb_path,
-                                    matching=["*unins000.exe"])
-            util_mod.apply_to_files(self.delete,
-                                    rb_path,
-                                    matching=["*unins000.dat"])
+                                    matching=["*.a",
+                                              "*.chm",
+                                              "*.pdf",
+                                              "*.html",
+                                              "*unins000.exe",
+                                              "*unins000.dat"])
 
         @staticmethod
         def _get_gem_dirs(user_installation, system_installation, version):
@@ -122,9 +127,12 @@ def get(container, util, shell, ver_info):
 
         def _active_environment(self, tuple_type):
             """Return variables that make up this container's active state."""
-            gem_dirs = RubyContainer._get_gem_dirs(self._installation,
-                                                   self._system_installation,
-                                                   self._version)
+            if self._gem_dirs is None:
+                self._gem_dirs = self._get_gem_dirs(self._installation,
+                                                    self._system_installation,
+                                                    self._version)
+
+            gem_dirs = self._gem_dirs
             env_to_overwrite = {
                 "GEM_PATH": "{0}{s}{1}{s}{2}".format(gem_dirs.home,
                                                      gem_dirs.site,
@@ -133,11 +141,7 @@ def get(container, util, shell, ver_info):
                 "GEM_HOME": gem_dirs.home
             }
             env_to_prepend = {
-                "PATH": os.pathsep.join([
-                    os.path.join(self._system_installation, "bin"),
-                    os.path.join(self._installation, "bin")
-                ])
-
+                "PATH": self._exec_path
             }
 
             return tuple_type(overwrite=env_to_overwrite,
@@ -202,20 +206,27 @@ def posix_ruby_installer(lang_dir,
     ruby_build_root = os.path.join(ruby_build_dir, "ruby-build")
     ruby_download_root = os.path.join(ruby_build_dir, "rvm-download")
 
-    if not os.path.exists(ruby_download_root):
+    # Check for the scripts we need from each checkout as opposed to the
+    # checkout directory itself, so that a checkout which previously
+    # failed part-way through gets cleared out and fetched again.
+    if not os.path.exists(os.path.join(ruby_download_root,
+                                       "bin",
+                                       "ruby-build")):
         with util.Task("""Downloading rvm-download"""):
             remote = "git://github.com/garnieretienne/rvm-download"
             dest = ruby_download_root
+            util.force_remove_tree(dest)
             util.execute(container,
                          util.output_on_fail,
                          "git", "clone", remote, dest,
                          instant_fail=True)
             util.force_remove_tree(os.path.join(dest, ".git"))
 
-    if not os.path.exists(ruby_build_root):
+    if not os.path.exists(os.path.join(ruby_build_root, "bin", "ruby-build")):
         with util.Task("""Downloading ruby-build"""):
             remote = "git://github.com/rbenv/ruby-build"
             dest = ruby_build_root
+            util.force_remove_tree(dest)
             util.execute(container,
                          util.output_on_fail,
                          "git", "clone", remote, dest,
@@ -265,7 +276,7 @@ def windows_ruby_installer(lang_dir, ruby_build_dir, container, util, shell):
                                    version + "-install.exe"),
                       "wb") as installer:
                 with closing(util.url_opener()(url)) as remote:
-                    installer.write(remote.read())
+                    shutil.copyfileobj(remote, installer, 64 * 1024)
 
             with util.Task("""Installing ruby version """ + version):
                 installer = os.path.realpath(installer.name)
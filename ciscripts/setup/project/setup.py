@@ -8,13 +8,6 @@
 import argparse
 
 
-def _prepare_project_deployment(cont, util, py_util, py_cont):
-    """Install travis-bump-version, necessary for deployment on any project."""
-    with util.Task("""Installing version bumper"""):
-        with py_cont.activated(util):
-            py_util.pip_install(cont, util, "travis-bump-version>=0.1.7")
-
-
 def _get_python_container(cont, util, shell):
     """Get python container to install linters into."""
     config_python = "setup/project/configure_python.py"
@@ -36,10 +29,9 @@ def _get_ruby_container(cont, util, shell):
                                                   rb_ver)
 
 
-def _install_markdownlint(cont, util, rb_cont):
+def _install_markdownlint(cont, util, rb_util, rb_cont):
     """Install markdownlint into this container."""
     with util.Task("""Installing markdownlint"""):
-        rb_util = cont.fetch_and_import("ruby_util.py")
         with rb_cont.activated(util):
             util.where_unavailable("mdl",
                                    rb_util.gem_install,
@@ -74,21 +66,24 @@ def run(cont, util, shell, argv=None):
         rb_cont = _get_ruby_container(cont, util, shell)
 
         if not parse_result.no_mdl:
-            _install_markdownlint(cont, util, rb_cont)
-
-        with util.Task("""Installing polysquare style guide linter"""):
+            rb_util = cont.fetch_and_import("ruby_util.py")
+            _install_markdownlint(cont, util, rb_util, rb_cont)
+
+        # Install the linter and anything needed for deployment with
+        # a single call to pip, so that we only pay for starting pip
+        # and resolving packages once. instant_fail now also covers
+        # travis-bump-version, which is deliberate: a deployment build
+        # cannot deploy without it, so it should fail straight away.
+        packages = ["polysquare-generic-file-linter>=0.1.7"]
+        util.prepare_deployment(packages.append, "travis-bump-version>=0.1.7")
+
+        with util.Task("""Installing linters and deployment tools"""):
             with py_cont.activated(util):
                 py_util.pip_install(cont,
                                     util,
-                                    "polysquare-generic-file-linter>=0.1.7",
+                                    *packages,
                                     instant_fail=True)
 
-        util.prepare_deployment(_prepare_project_deployment,
-                                cont,
-                                util,
-                                py_util,
-                                py_cont)
-
         meta_container = util.make_meta_container((py_cont, rb_cont))
         util.register_result("_POLYSQUARE_SETUP_GENERIC_PROJECT",
                              meta_container)
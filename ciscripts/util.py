@@ -5,6 +5,8 @@
 # See /LICENCE.md for Copyright information
 """General utility functions which are made available to all other scripts."""
 
+import codecs
+
 import errno
 
 import fnmatch
@@ -15,6 +17,8 @@ import os
 
 import platform
 
+import re
+
 import shutil
 
 import stat
@@ -32,10 +36,10 @@ from collections import defaultdict
 from contextlib import contextmanager
 
 try:
-    from Queue import Queue, Empty
+    import selectors
 except ImportError:
-    # suppress(F811,E301,E101,F401,import-error,unused-import)
-    from queue import Queue, Empty
+    # suppress(invalid-name)
+    selectors = None
 
 
 _PREFERRED_VERSIONS = {
@@ -128,9 +132,14 @@ def overwrite_environment_variable(parent, key, value):
 
 def prepend_environment_variable(parent, key, value):
     """Prepend value to the environment variable list in key."""
-    os.environ[key] = "{0}{1}{2}".format(str(value),
-                                         os.pathsep,
-                                         os.environ.get(key) or "")
+    current = os.environ.get(key)
+
+    # Don't leave a trailing separator behind if there was nothing
+    # to prepend to.
+    if current:
+        os.environ[key] = str(value) + os.pathsep + current
+    else:
+        os.environ[key] = str(value)
 
     if parent:
         parent.prepend_environment_variable(key, value)
@@ -160,22 +169,28 @@ def maybe_environ(key):
         return ""
 
 
-def _match_all(abs_dir, matching, not_matching):
-    """Return all directories in abs_dirs matching all expressions."""
-    num_not_matching = 0
+def compile_patterns(patterns):
+    """Compile case-normalized glob patterns into regular expressions.
 
-    for expression in matching:
-        if not fnmatch.fnmatch(abs_dir, expression):
-            num_not_matching += 1
+    This is what fnmatch.fnmatch does on every call, so doing it up front
+    means that each pattern is only translated once per tree walk. Callers
+    that walk several trees with the same patterns can compile them once
+    with this function and pass the result as matching or not_matching.
+    Patterns which are already compiled are passed through unchanged.
+    """
+    return tuple([p if hasattr(p, "match")
+                  else re.compile(fnmatch.translate(os.path.normcase(p)))
+                  for p in patterns or tuple()])
 
-    if num_not_matching == len(matching):
-        return False
 
-    for expression in not_matching:
-        if fnmatch.fnmatch(abs_dir, expression):
-            return False
+def _match_all(abs_dir, matching, not_matching):
+    """Return whether abs_dir matches any of matching and none of not_matching.
 
-    return True
+    Both matching and not_matching must already be compiled.
+    """
+    abs_dir = os.path.normcase(abs_dir)
+    return (any(e.match(abs_dir) for e in matching) and
+            not any(e.match(abs_dir) for e in not_matching))
 
 
 def apply_to_files(func, tree_node, matching=None, not_matching=None):
@@ -183,15 +198,16 @@ def apply_to_files(func, tree_node, matching=None, not_matching=None):
 
     Function will be applied to all filenames matching 'matching', but
     will not be applied to any file matching matching 'not_matching'.
+    Patterns may be glob strings or the result of compile_patterns.
     """
     result = []
-    matching = [os.path.normcase(m) for m in matching or list()]
-    not_matching = [os.path.normcase(m) for m in not_matching or list()]
+    matching = compile_patterns(matching)
+    not_matching = compile_patterns(not_matching)
     for root, _, filenames in os.walk(tree_node):
-        abs_files = [os.path.join(root, f) for f in filenames]
-        result.extend([func(f) for f in abs_files if _match_all(f,
-                                                                matching,
-                                                                not_matching)])
+        for filename in filenames:
+            abs_file = os.path.join(root, filename)
+            if _match_all(abs_file, matching, not_matching):
+                result.append(func(abs_file))
 
     return result
 
@@ -201,15 +217,16 @@ def apply_to_directories(func, tree_node, matching=None, not_matching=None):
 
     Function will be applied to all filenames matching 'matching', but
     will not be applied to any file matching matching 'not_matching'.
+    Patterns may be glob strings or the result of compile_patterns.
     """
     result = []
-    matching = [os.path.normcase(m) for m in matching or list()]
-    not_matching = [os.path.normcase(m) for m in not_matching or list()]
+    matching = compile_patterns(matching)
+    not_matching = compile_patterns(not_matching)
     for root, directories, _, in os.walk(tree_node):
-        abs_dirs = [os.path.join(root, d) for d in directories]
-        result.extend([func(d) for d in abs_dirs if _match_all(d,
-                                                               matching,
-                                                               not_matching)])
+        for directory in directories:
+            abs_dir = os.path.join(root, directory)
+            if _match_all(abs_dir, matching, not_matching):
+                result.append(func(abs_dir))
 
     return result
 
@@ -229,6 +246,7 @@ class IndentedLogger(object):
 
     _indent_level = 0
     _printed_on_secondary_indents = False
+    _indents = [""]
 
     @staticmethod  # suppress(PYC90)
     def __enter__():
@@ -257,10 +275,18 @@ class IndentedLogger(object):
     @staticmethod
     def message(message_to_print):
         """Print a message, with a pre-newline, splitting on newlines."""
-        if IndentedLogger._indent_level > 0:
-            IndentedLogger._printed_on_secondary_indents = True
+        level = IndentedLogger._indent_level
+        if level == 0:
+            print_message(message_to_print)
+            return
+
+        IndentedLogger._printed_on_secondary_indents = True
+
+        indents = IndentedLogger._indents
+        while len(indents) <= level:
+            indents.append(len(indents) * "    ")
 
-        indent = IndentedLogger._indent_level * "    "
+        indent = indents[level]
         formatted = message_to_print.replace("\r", "\r" + indent)
         formatted = formatted.replace("\n", "\n" + indent)
         print_message(formatted)
@@ -302,15 +328,62 @@ class Task(object):
         Task.nest_level -= 1
 
 
-@contextmanager
-def thread_output(*args, **kwargs):
-    """Get return value of thread as queue, joining on end."""
-    return_queue = Queue()
-    kwargs["args"] = (kwargs["args"] or tuple()) + (return_queue, )
-    thread = threading.Thread(*args, **kwargs)
-    thread.start()
-    yield return_queue
-    thread.join()
+def _read_chunks_from(index, handle, on_chunk):
+    """Call on_chunk with index and each chunk read from handle, until EOF."""
+    while True:
+        chunk = os.read(handle.fileno(), 64 * 1024)
+        on_chunk(index, chunk)
+
+        if not chunk:
+            return
+
+
+def read_chunks(outputs, on_chunk):
+    """Call on_chunk(index, chunk) for each chunk read from outputs.
+
+    The index is the position of the stream that the chunk was read from
+    in outputs. Once a stream reaches EOF, on_chunk is called with an
+    empty chunk for that stream.
+
+    Where possible, all the streams are read from the calling thread
+    by waiting on a selector. Windows can't wait on pipes and Python 2
+    doesn't have selectors, so in those cases every stream but the last
+    is read on its own thread.
+    """
+    if selectors is None or platform.system() == "Windows":
+        threads = [threading.Thread(target=_read_chunks_from,
+                                    args=(index, handle, on_chunk))
+                   for index, handle in enumerate(outputs[:-1])]
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            _read_chunks_from(len(outputs) - 1, outputs[-1], on_chunk)
+        finally:
+            for thread in threads:
+                thread.join()
+
+        return
+
+    selector = selectors.DefaultSelector()
+
+    try:
+        for index, handle in enumerate(outputs):
+            selector.register(handle, selectors.EVENT_READ, index)
+
+        remaining = len(outputs)
+        while remaining:
+            for key, _ in selector.select():
+                chunk = os.read(key.fd, 64 * 1024)
+
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    remaining -= 1
+
+                on_chunk(key.data, chunk)
+    finally:
+        selector.close()
 
 
 def running_output(process, outputs):
@@ -322,46 +395,48 @@ def running_output(process, outputs):
                      "read_first_byte": False
                  })
 
-    def output_printer(file_handle):
-        """Thread that prints the output of this process."""
-        character = bytearray()
-        while True:
-            character += file_handle.read(1)
-            try:
-                if character:
-                    if not state.read_first_byte:
-                        state.read_first_byte = True
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    stderr_chunks = []
 
-                        if character != "\n":
-                            IndentedLogger.message("\n")
+    def output_printer(index, chunk):
+        """Print chunks from stdout and hold on to chunks from stderr.
 
-                    # If this fails, then we will just read further characters
-                    # until the decode succeeds.
-                    IndentedLogger.message(character.decode("utf-8"))
-                    state.printed_message = True
-                    character = bytearray()
-                else:
-                    return
-            except UnicodeDecodeError:
-                continue
+        Output is printed in whatever sized chunks are available on the
+        pipe as opposed to byte-by-byte. The incremental decoder holds on
+        to any partial utf-8 sequence at the end of a chunk until the
+        rest of it arrives.
+        """
+        if index != 0:
+            stderr_chunks.append(chunk)
+            return
 
-    stdout = threading.Thread(target=output_printer, args=(outputs[0], ))
+        if chunk:
+            if not state.read_first_byte:
+                state.read_first_byte = True
 
-    stdout.start()
-    stderr_lines = list(outputs[1])
+                if chunk[:1] != b"\n":
+                    IndentedLogger.message("\n")
+
+            message = decoder.decode(chunk)
+        else:
+            message = decoder.decode(b"", True)
+
+        if message:
+            IndentedLogger.message(message)
+            state.printed_message = True
 
     try:
-        status = process.wait()
+        read_chunks(outputs, output_printer)
     finally:
-        stdout.join()
+        status = process.wait()
+
+    stderr = b"".join(stderr_chunks)
 
     # Print a new line before printing any stderr messages
-    if len(stderr_lines):
+    if len(stderr):
         IndentedLogger.message("\n")
-
-        for line in stderr_lines:
-            IndentedLogger.message(line.decode("utf-8"))
-            state.printed_message = True
+        IndentedLogger.message(stderr.decode("utf-8", "replace"))
+        state.printed_message = True
 
     if state.printed_message:
         print_message("\n")
@@ -383,17 +458,11 @@ def output_on_fail(process, outputs):
     if status is not None:
         return status
 
-    def reader(handle, input_queue):
-        """Thread which reads handle, until EOF."""
-        input_queue.put(handle.read())
-
-    with thread_output(target=reader, args=(outputs[0], )) as stdout_queue:
-        with thread_output(target=reader,
-                           args=(outputs[1], )) as stderr_queue:
-            stdout = stdout_queue.get()
-            stderr = stderr_queue.get()
-
-    status = process.wait()
+    # Nothing is shown unless the process fails, so there is no need
+    # to stream the output. Let communicate read both pipes and wait
+    # for the process in one go.
+    stdout, stderr = process.communicate()
+    status = process.returncode
 
     if status != 0:
         IndentedLogger.message("\n")
@@ -411,25 +480,20 @@ def long_running_suppressed_output(dot_timeout=10):
         if status is not None:
             return status
 
-        def print_dots(status_queue):
-            """Print a dot every dot_timeout seconds."""
-            while True:
-                # Exit when something gets written to the pipe
-                try:
-                    status_queue.get(True, dot_timeout)
-                    return
-                except Empty:
-                    IndentedLogger.dot()
-
-        status_queue = Queue()
+        def print_dots(done):
+            """Print a dot every dot_timeout seconds until done is set."""
+            while not done.wait(dot_timeout):
+                IndentedLogger.dot()
+
+        done = threading.Event()
         dots_thread = threading.Thread(target=print_dots,
-                                       args=(status_queue, ))
+                                       args=(done, ))
         dots_thread.start()
 
         try:
             status = output_on_fail(process, outputs)
         finally:
-            status_queue.put("done")
+            done.set()
             dots_thread.join()
 
         return status
@@ -485,7 +549,7 @@ def process_shebang(args):
     try:
         with open(path_to_exec, "rt") as exec_file:
             if exec_file.read(2) == "#!":
-                shebang = exec_file.readline().strip().replace("\n", "")
+                shebang = exec_file.readline().strip()
                 shebang_args = shebang.split(" ")
 
                 # Try to handle the case where the shebang executable
@@ -520,13 +584,17 @@ def force_remove_tree(directory):
     then fall back to shelling out to rmdir on Windows or rm -rf on
     Unix.
     """
-    # If this is not a directory, just try removing the file directly
-    if os.path.isdir(directory):
+    # If this is not a directory, just try removing the file directly.
+    # Symbolic links are removed as files, even if they point to a
+    # directory.
+    if os.path.isdir(directory) and not os.path.islink(directory):
         _try_ignoring_ent_and_perm(shutil.rmtree, directory)
     else:
         _try_ignoring_ent_and_perm(os.remove, directory)
 
-    if os.path.exists(directory):
+    # Use lexists so that a dangling link left behind still counts as
+    # not removed, as opposed to following it to a missing target.
+    if os.path.lexists(directory):
         print_message("shutil.rmtree failed, shelling out to rm\n")
         # On Windows, we might get PermissionError when attempting
         # to delete things, so shell out to /rmdir.exe to handle
@@ -551,9 +619,14 @@ def execute(container, output_strategy, *args, **kwargs):
     (either suppressed, or forwarded to stderr). Remaining arguments
     will be passed to Popen.
     """
-    env = os.environ.copy()
+    # Only copy the environment if we need to add something to it,
+    # otherwise pass it through as is. os.environ is passed explicitly
+    # rather than leaving env as None, since os.environ may have been
+    # replaced since this process started.
+    env = os.environ
 
     if kwargs.get("env"):
+        env = os.environ.copy()
         env.update(kwargs["env"])
 
     try:
@@ -582,8 +655,10 @@ def execute(container, output_strategy, *args, **kwargs):
                                    stderr=subprocess.PIPE,
                                    env=env)
     except OSError as error:
+        # cmd may not have been assigned yet if process_shebang failed,
+        # so report the arguments that we were called with.
         raise Exception(u"""Failed to execute """
-                        u"""{0} - {1}""".format(" ".join(cmd), str(error)))
+                        u"""{0} - {1}""".format(" ".join(args), str(error)))
 
     with close_file_pair((process.stdout, process.stderr)) as outputs:
         status = output_strategy(process, outputs)
@@ -601,13 +676,36 @@ def execute(container, output_strategy, *args, **kwargs):
         return status
 
 
+_WHICH_CACHE = dict()
+
+
+def _directory_mtime(path):
+    """Return modification time of the directory at path or None."""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
 def which(executable):
-    """Full path to executable."""
+    """Full path to executable, remembering successful lookups."""
+    on_windows = platform.system() == "Windows"
+
     def is_executable(path):
-        """True if path exists and is executable."""
-        return (os.path.exists(path) and
-                not os.path.isdir(path) and
-                os.access(path, os.F_OK | os.X_OK))
+        """True if path exists and is executable.
+
+        A single stat tells us both whether path is a file and whether
+        any of its execute bits are set. There are no execute bits on
+        Windows, so any file counts as executable there.
+        """
+        try:
+            mode = os.stat(path).st_mode
+        except OSError:
+            return False
+
+        return (stat.S_ISREG(mode) and
+                (on_windows or
+                 bool(mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH))))
 
     def normalize(path):
         """Return canonical case-normalized path."""
@@ -621,20 +719,54 @@ def which(executable):
         """Get list of extensions to automatically search."""
         return (os.environ.get("PATHEXT") or "").split(os.pathsep)
 
+    # Relative and empty PATH entries are resolved against the current
+    # directory, so the result depends on it as well.
+    key = (executable,
+           os.environ.get("PATH", None),
+           os.environ.get("PATHEXT", None))
+
+    if not all([os.path.isabs(p) for p in path_list()]):
+        key += (os.getcwd(), )
+
+    # A remembered result is only returned if it is still executable and
+    # every PATH entry searched before it still resolves to the same
+    # directory, without that directory having been modified since. That
+    # way an executable installed earlier in PATH, or a symlinked PATH
+    # entry being repointed, is noticed. The modification check is only
+    # as precise as the filesystem's timestamps. Failed lookups are not
+    # remembered, since we usually go on to install whatever was not
+    # found.
+    try:
+        cached_path, searched = _WHICH_CACHE[key]
+        if (is_executable(cached_path) and
+                all([normalize(r) == d and _directory_mtime(d) == m
+                     for r, d, m in searched])):
+            return cached_path
+    except KeyError:  # suppress(pointless-except)
+        pass
+
     seen = set()
+    searched = list()
+
+    # An unset PATHEXT splits into a single empty extension, which is
+    # the same as the executable name itself, so skip empty extensions.
+    names = [executable] + [executable + e for e in pathext_list() if e]
+
+    for raw_path in path_list():
+        path = normalize(raw_path)
+        searched.append((raw_path, path, _directory_mtime(path)))
 
-    for path in [normalize(p) for p in path_list()]:
         if path not in seen:
-            for ext in [""] + pathext_list():
-                full_path = os.path.join(path, executable) + ext
+            for name in names:
+                full_path = os.path.join(path, name)
                 if is_executable(full_path):
+                    _WHICH_CACHE[key] = (full_path, searched)
                     return full_path
 
             seen.add(path)
 
     return None
 
-
 def where_unavailable(executable,
                       function,
                       *args,
@@ -669,13 +801,18 @@ def where_unavailable(executable,
 
 
 def compare_contents(lhs, rhs):
-    """Compare contents of two specified files."""
-    for filename in (lhs, rhs):
-        if not os.path.exists(filename):
-            return False
+    """Compare contents of two specified files.
 
-    with open(lhs, "r") as lhs_file, open(rhs, "r") as rhs_file:
-        return lhs_file.read() == rhs_file.read()
+    If either file does not exist then the contents are not the same.
+    """
+    try:
+        with open(lhs, "r") as lhs_file, open(rhs, "r") as rhs_file:
+            return lhs_file.read() == rhs_file.read()
+    except IOError as error:
+        if error.errno != errno.ENOENT:  # suppress(PYC90)
+            raise error
+
+        return False
 
 
 def store_file_mtime_in(source, output_filename):
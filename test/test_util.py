@@ -25,6 +25,8 @@ import time
 
 from collections import namedtuple
 
+from contextlib import contextmanager
+
 from test import testutil
 
 import ciscripts.util as util
@@ -33,7 +35,7 @@ from ciscripts.bootstrap import (BashParentEnvironment,    # suppress(I100)
                                  PowershellParentEnvironment,
                                  escaped_printer_with_character)
 
-from mock import Mock
+from mock import Mock, patch
 
 from nose_parameterized import param, parameterized
 
@@ -71,11 +73,14 @@ class OverwrittenEnvironmentVarsTestCase(TestCase):
     def setUp(self):  # suppress(N802)
         """Set up this test case by saving the current environment."""
         super(OverwrittenEnvironmentVarsTestCase, self).setUp()
-        self._saved_environ = os.environ.copy()
+        self._saved_environ = dict(os.environ)
 
     def tearDown(self):  # suppress(N802)
         """Tear down this test case by restoring the saved environment."""
-        os.environ = self._saved_environ
+        # Restore os.environ in place, so that it remains the real
+        # environment mapping for the next test.
+        os.environ.clear()
+        os.environ.update(self._saved_environ)
         super(OverwrittenEnvironmentVarsTestCase, self).tearDown()
 
 
@@ -111,11 +116,6 @@ class ParentEnvConfig(namedtuple("ParentEnvConfig",
 class TestOverwriteEnvironmentVariables(OverwrittenEnvironmentVarsTestCase):
     """Test case for util.overwrite_environment_variable."""
 
-    def __init__(self, *args, **kwargs):
-        """Initialize instance variables, including parent environment."""
-        super(TestOverwriteEnvironmentVariables, self).__init__(*args,
-                                                                **kwargs)
-
     PARENT_ENVIRONMENTS = [
         param(ParentEnvConfig(bash_parent_environment(),
                               ":",
@@ -165,6 +165,15 @@ class TestOverwriteEnvironmentVariables(OverwrittenEnvironmentVarsTestCase):
                         MatchesAll(Contains("VALUE"),
                                    Contains("SECOND_VALUE")))
 
+    def test_prepend_to_unset_environment_variable(self):
+        """Prepending to an unset variable leaves no trailing separator."""
+        os.environ.pop("VAR", None)
+
+        with testutil.CapturedOutput():
+            util.prepend_environment_variable(Mock(), "VAR", "VALUE")
+
+        self.assertEqual(os.environ["VAR"], "VALUE")
+
     @parameterized.expand(PARENT_ENVIRONMENTS)
     def test_prepended_environment_variables_in_parent(self, config):
         """Prepended variables appear in parent shell environment."""
@@ -306,6 +315,16 @@ def _utf8_print_cmd():
                         "utf8_print_cmd.txt")
 
 
+# Write more than a pipe buffer's worth to both stdout and stderr before
+# exiting, so that a reader which only drained one of them would block.
+_LARGE_OUTPUT_SIZE = 256 * 1024
+_LARGE_OUTPUT_CMD = ("import sys; "
+                     "sys.stdout.write('o' * {0}); "
+                     "sys.stdout.flush(); "
+                     "sys.stderr.write('e' * {0}); "
+                     "sys.stderr.flush()").format(_LARGE_OUTPUT_SIZE)
+
+
 class TestExecute(TestCase):
     """Test case for util.execute."""
 
@@ -415,6 +434,26 @@ class TestExecute(TestCase):
                                        doctest.ELLIPSIS |
                                        doctest.NORMALIZE_WHITESPACE))
 
+    def test_running_output_handles_utf8_split_across_reads(self):
+        """Decode a utf-8 character written in two separate pieces."""
+        if sys.version_info.major != 3:
+            self.skipTest("""Output is only decoded to text on Python 3""")
+
+        captured_output = testutil.CapturedOutput()
+        with captured_output:
+            util.execute(Mock(),
+                         util.running_output,
+                         "python",
+                         "-c",
+                         "import os, time; "
+                         "c = u'\\N{check mark}'.encode('utf-8'); "
+                         "os.write(1, c[:1]); "
+                         "time.sleep(0.1); "
+                         "os.write(1, c[1:])")
+
+        self.assertEqual(captured_output.stderr,
+                         u"\n\N{check mark}\n")
+
     def test_output_on_fail_handles_utf8(self):
         """Handle utf-8 strings correctly when showing failure output."""
         if "POLYSQUARE_ALWAYS_PRINT_PROCESS_OUTPUT" in os.environ:
@@ -455,6 +494,42 @@ class TestExecute(TestCase):
         self.assertEqual(captured_output.stderr.replace("\r\n", "\n"),
                          "\na\nbd\nc\n")
 
+    def test_running_output_large_stdout_and_stderr(self):
+        """Stream large stdout, then show large stderr, without blocking."""
+        captured_output = testutil.CapturedOutput()
+        with captured_output:
+            util.execute(Mock(),
+                         util.running_output,
+                         "python",
+                         "-c",
+                         _LARGE_OUTPUT_CMD)
+
+        self.assertEqual(captured_output.stderr.replace("\r\n", "\n"),
+                         "\n" +
+                         "o" * _LARGE_OUTPUT_SIZE +
+                         "\n" +
+                         "e" * _LARGE_OUTPUT_SIZE +
+                         "\n")
+
+    def test_read_chunks_with_threads_reads_all_output(self):
+        """Read all of both streams when selectors are unavailable."""
+        process = subprocess.Popen(["python", "-c", _LARGE_OUTPUT_CMD],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        chunks = ([], [])
+
+        with util.close_file_pair((process.stdout,
+                                   process.stderr)) as outputs:
+            with patch.object(util, "selectors", None):
+                util.read_chunks(outputs,
+                                 lambda i, chunk: chunks[i].append(chunk))
+
+        process.wait()
+
+        self.assertEqual((b"".join(chunks[0]), b"".join(chunks[1])),
+                         (b"o" * _LARGE_OUTPUT_SIZE,
+                          b"e" * _LARGE_OUTPUT_SIZE))
+
     def test_running_output_no_double_leading_slash_n(self):
         """Using running_output does not allow double-leading slash-n."""
         captured_output = testutil.CapturedOutput()
@@ -470,19 +545,28 @@ class TestExecute(TestCase):
                                        doctest.ELLIPSIS |
                                        doctest.NORMALIZE_WHITESPACE))
 
-    def test_execute_show_dots_for_long_running_processes(self):
+    def test_show_dots_for_long_running_processes(self):
         """Show dots for long running processes."""
         if "POLYSQUARE_ALWAYS_PRINT_PROCESS_OUTPUT" in os.environ:
             del os.environ["POLYSQUARE_ALWAYS_PRINT_PROCESS_OUTPUT"]
 
+        # Use a stand-in for a process that takes a while to finish, so
+        # that we don't need to start a real one to test the strategy.
+        def communicate():
+            """Wait as though the process were still running."""
+            time.sleep(0.3)
+            return (b"", b"")
+
+        process = Mock(returncode=0)
+        process.communicate.side_effect = communicate
+        strategy = util.long_running_suppressed_output(dot_timeout=0.1)
+
         captured_output = testutil.CapturedOutput()
         with captured_output:
-            util.execute(Mock(),
-                         util.long_running_suppressed_output(dot_timeout=1),
-                         "sleep", "3")
+            strategy(process, (Mock(), Mock()))
 
         # There will be fewer dots as the watcher thread start a little
-        # later than the subprocess does. However, there can be some cases
+        # later than the process does. However, there can be some cases
         # where there's a little bit of lag between terminating threads, so
         # there might be three dots. Match both cases.
         self.assertThat(captured_output.stderr.strip(),
@@ -498,6 +582,29 @@ def _full_path_if_exists(path):
         return os.path.basename(path)
 
 
+@contextmanager
+def _executable_temporary_file(directory, suffix=""):
+    """Create an executable python script in directory, yielding its path.
+
+    The script is written through a raw file descriptor, as there is no
+    need for a buffered file object just to write the shebang. Its mode
+    is set explicitly afterwards, so as not to depend on the umask.
+    """
+    handle, path = tempfile.mkstemp(dir=directory, suffix=suffix)
+
+    try:
+        os.write(handle, b"#!/usr/bin/env python\nprint(\"Test\")")
+    finally:
+        os.close(handle)
+
+    os.chmod(path, 0o755)
+
+    try:
+        yield path
+    finally:
+        os.remove(path)
+
+
 class TestExecutablePaths(OverwrittenEnvironmentVarsTestCase):
     """Test cases for executable path functions (util.which)."""
 
@@ -506,16 +613,12 @@ class TestExecutablePaths(OverwrittenEnvironmentVarsTestCase):
         temp_dir = tempfile.mkdtemp(prefix=os.path.join(os.getcwd(),
                                                         "executable_path"))
         self.addCleanup(lambda: util.force_remove_tree(temp_dir))
-        with tempfile.NamedTemporaryFile(mode="wt",
-                                         dir=temp_dir) as temp_file:
-            temp_file.write("#!/usr/bin/env python\nprint(\"Test\")")
-            os.chmod(temp_file.name, 755)
-
+        with _executable_temporary_file(temp_dir) as executable:
             with ExpectedException(RuntimeError):
                 os.environ["PATH"] = "/does_not_exist"
                 util.execute(Mock(),
                              util.long_running_suppressed_output(),
-                             os.path.basename(temp_file.name))
+                             os.path.basename(executable))
 
     def test_find_executable_file_in_path(self):
         """Find an executable file in the current PATH."""
@@ -524,16 +627,25 @@ class TestExecutablePaths(OverwrittenEnvironmentVarsTestCase):
                                   os.pathsep +
                                   (os.environ.get("PATH") or ""))
 
-            with tempfile.NamedTemporaryFile(mode="wt",
-                                             dir=temp_dir) as temp_file:
-                temp_file.write("#!/usr/bin/env python\nprint(\"Test\")")
-                os.chmod(temp_file.name,
-                         os.stat(temp_file.name).st_mode | stat.S_IRWXU)
-
-                which_result = util.which(os.path.basename(temp_file.name))
-                self.assertEqual(temp_file.name.lower(),
+            with _executable_temporary_file(temp_dir) as executable:
+                which_result = util.which(os.path.basename(executable))
+                self.assertEqual(executable.lower(),
                                  which_result.lower())
 
+    def test_removed_executable_not_found_again(self):
+        """Don't return a previously found executable once it is removed."""
+        with testutil.in_tempdir(os.getcwd(), "executable_path") as temp_dir:
+            os.environ["PATH"] = (temp_dir +
+                                  os.pathsep +
+                                  (os.environ.get("PATH") or ""))
+
+            with _executable_temporary_file(temp_dir) as executable:
+                name = os.path.basename(executable)
+                self.assertEqual(executable.lower(),
+                                 util.which(name).lower())
+
+            self.assertEqual(None, util.which(name))
+
     def test_find_executable_file_using_pathext(self):
         """Find an executable file using PATHEXT."""
         with testutil.in_tempdir(os.getcwd(), "executable_path") as temp_dir:
@@ -542,16 +654,12 @@ class TestExecutablePaths(OverwrittenEnvironmentVarsTestCase):
                                   (os.environ.get("PATH") or ""))
             os.environ["PATHEXT"] = ".exe"
 
-            with tempfile.NamedTemporaryFile(mode="wt",
-                                             dir=temp_dir,
-                                             suffix=".exe") as temp_file:
-                temp_file.write("#!/usr/bin/env python\nprint(\"Test\")")
-                os.chmod(temp_file.name, 755)
-
-                name = os.path.splitext(os.path.basename(temp_file.name))[0]
+            with _executable_temporary_file(temp_dir,
+                                            suffix=".exe") as executable:
+                name = os.path.splitext(os.path.basename(executable))[0]
 
                 which_result = util.which(name)
-                self.assertEqual(temp_file.name.lower(),
+                self.assertEqual(executable.lower(),
                                  which_result.lower())
 
     def test_process_shebang(self):
@@ -584,7 +692,7 @@ class TestExecutablePaths(OverwrittenEnvironmentVarsTestCase):
             with open(os.path.join(temp_dir, "script.py"), "wt") as temp_file:
                 temp_file.write("#!/usr/bin/env python\nprint(\"Test\")")
 
-            os.chmod(temp_file.name, 755)
+            os.chmod(temp_file.name, 0o755)
 
             cmdline = util.process_shebang([temp_file.name])
             self.assertEqual(cmdline, [temp_file.name])
@@ -609,15 +717,11 @@ class TestExecutablePaths(OverwrittenEnvironmentVarsTestCase):
         temp_dir = tempfile.mkdtemp(prefix=os.path.join(os.getcwd(),
                                                         "executable_path"))
         self.addCleanup(lambda: util.force_remove_tree(temp_dir))
-        with tempfile.NamedTemporaryFile(mode="wt",
-                                         dir=temp_dir) as temp_file:
-            temp_file.write("#!/usr/bin/env python\nprint(\"Test\")")
-            os.chmod(temp_file.name, 755)
-
+        with _executable_temporary_file(temp_dir) as executable:
             os.environ["PATH"] = ""
 
             self.assertEqual(None,
-                             util.which(os.path.basename(temp_file.name)))
+                             util.which(os.path.basename(executable)))
 
     def test_symlinks_in_path_get_resolved(self):
         """Returned executable path has symlinks resolved."""
@@ -635,13 +739,39 @@ class TestExecutablePaths(OverwrittenEnvironmentVarsTestCase):
 
             os.environ["PATH"] = link + os.pathsep + path_var
 
-            with tempfile.NamedTemporaryFile(mode="wt",
-                                             dir=linked) as temp_file:
-                temp_file.write("#!/usr/bin/env python\nprint(\"Test\")")
-                os.chmod(temp_file.name, 755)
+            with _executable_temporary_file(linked) as executable:
+                self.assertEqual(executable,
+                                 util.which(os.path.basename(executable)))
 
-                self.assertEqual(temp_file.name,
-                                 util.which(os.path.basename(temp_file.name)))
+    def test_repointed_symlinks_in_path_get_resolved(self):
+        """Find executable in new target after a symlink in PATH changes."""
+        if platform.system() == "Windows":
+            self.skipTest("symlinks not supported on Windows")
+
+        with testutil.in_tempdir(os.getcwd(), "executable_path") as temp_dir:
+            link = os.path.join(temp_dir, "link")
+            first = os.path.join(temp_dir, "first")
+            second = os.path.join(temp_dir, "second")
+            name = os.path.basename(temp_dir) + "_tool"
+
+            for directory in (first, second):
+                os.mkdir(directory)
+                with open(os.path.join(directory, name), "wt") as script:
+                    script.write("#!/usr/bin/env python\nprint(\"Test\")")
+
+                os.chmod(script.name, 0o755)
+
+            os.symlink(first, link)
+            os.environ["PATH"] = (link +
+                                  os.pathsep +
+                                  (os.environ.get("PATH") or ""))
+
+            self.assertEqual(os.path.join(first, name), util.which(name))
+
+            os.remove(link)
+            os.symlink(second, link)
+
+            self.assertEqual(os.path.join(second, name), util.which(name))
 
     def test_resolve_relative_paths(self):
         """Resolve relative paths in PATH."""
@@ -653,28 +783,42 @@ class TestExecutablePaths(OverwrittenEnvironmentVarsTestCase):
                                                            os.pathsep,
                                                            path_var)
 
-            with tempfile.NamedTemporaryFile(mode="wt",
-                                             dir=temp_dir) as temp_file:
-                temp_file.write("#!/usr/bin/env python\nprint(\"Test\")")
-                os.chmod(temp_file.name, 755)
-
-                which_result = util.which(os.path.basename(temp_file.name))
-                self.assertEqual(temp_file.name.lower(),
+            with _executable_temporary_file(temp_dir) as executable:
+                which_result = util.which(os.path.basename(executable))
+                self.assertEqual(executable.lower(),
                                  which_result.lower())
 
+    def test_relative_paths_resolved_in_current_directory(self):
+        """Resolve relative paths in PATH against the current directory."""
+        with testutil.in_tempdir(os.getcwd(), "executable_path") as temp_dir:
+            first = os.path.join(temp_dir, "first")
+            second = os.path.join(temp_dir, "second")
+            os.mkdir(first)
+            os.mkdir(second)
+
+            os.environ["PATH"] = (os.curdir +
+                                  os.pathsep +
+                                  (os.environ.get("PATH") or ""))
+
+            with _executable_temporary_file(first) as executable:
+                name = os.path.basename(executable)
+
+                with util.in_dir(first):
+                    self.assertEqual(executable.lower(),
+                                     util.which(name).lower())
+
+                with util.in_dir(second):
+                    self.assertEqual(None, util.which(name))
+
     # suppress(no-self-use)
     def test_execute_function_if_not_found_by_which(self):
         """Execute function with where_unavailable if executable not found."""
         temp_dir = tempfile.mkdtemp(prefix=os.path.join(os.getcwd(),
                                                         "executable_path"))
         self.addCleanup(lambda: util.force_remove_tree(temp_dir))
-        with tempfile.NamedTemporaryFile(mode="wt",
-                                         dir=temp_dir) as temp_file:
-            temp_file.write("#!/usr/bin/env python\nprint(\"Test\")")
-            os.chmod(temp_file.name, 755)
-
+        with _executable_temporary_file(temp_dir) as executable:
             mock = Mock()
-            util.where_unavailable(os.path.basename(temp_file.name),
+            util.where_unavailable(os.path.basename(executable),
                                    mock,
                                    "arg")
 
@@ -684,17 +828,13 @@ class TestExecutablePaths(OverwrittenEnvironmentVarsTestCase):
     def test_no_execute_function_if_found_by_which(self):
         """where_unavailable doesn't execute function if executable found."""
         with testutil.in_tempdir(os.getcwd(), "executable_path") as temp_dir:
-            with tempfile.NamedTemporaryFile(mode="wt",
-                                             dir=temp_dir) as temp_file:
-                temp_file.write("#!/usr/bin/env python\nprint(\"Test\")")
-                os.chmod(temp_file.name, 755)
-
+            with _executable_temporary_file(temp_dir) as executable:
                 with testutil.environment_copy():
                     os.environ["PATH"] = (os.environ["PATH"] +
                                           os.pathsep +
                                           temp_dir)
                     mock = Mock()
-                    util.where_unavailable(os.path.basename(temp_file.name),
+                    util.where_unavailable(os.path.basename(executable),
                                            mock,
                                            "arg")
                     self.assertEquals(mock.call_args_list, list())
@@ -754,6 +894,43 @@ class TestApplicationToFilePatterns(TestCase):
 
                 function_applied.assert_called_with(temp_file.name)
 
+    # suppress(no-self-use)
+    def test_apply_to_matching_files_by_compiled_patterns(self):
+        """Apply functions to files matching precompiled patterns."""
+        with testutil.in_tempdir(os.getcwd(), "file_patterns") as temp_dir:
+            with tempfile.NamedTemporaryFile(mode="wt",
+                                             dir=temp_dir,
+                                             suffix=".tmp") as temp_file:
+                temp_file.write("")
+                temp_file.flush()
+
+                function_applied = Mock()
+                util.apply_to_files(function_applied,
+                                    temp_dir,
+                                    matching=util.compile_patterns(["*.tmp"]))
+
+                function_applied.assert_called_with(temp_file.name)
+
+    # suppress(no-self-use)
+    def test_apply_to_matching_files_in_subdirectories(self):
+        """Apply functions to matching files in nested subdirectories."""
+        with testutil.in_tempdir(os.getcwd(), "file_patterns") as temp_dir:
+            nested_dir = os.path.join(temp_dir, "nested")
+            os.mkdir(nested_dir)
+
+            with tempfile.NamedTemporaryFile(mode="wt",
+                                             dir=nested_dir,
+                                             suffix=".tmp") as temp_file:
+                temp_file.write("")
+                temp_file.flush()
+
+                function_applied = Mock()
+                util.apply_to_files(function_applied,
+                                    temp_dir,
+                                    matching=["*.tmp"])
+
+                function_applied.assert_called_with(temp_file.name)
+
     # suppress(no-self-use)
     def test_no_apply_files_not_matching_suffix(self):
         """Don't apply functions to files not matching suffix."""